@@ -0,0 +1,353 @@
+"""Keep a virtual lux sensor in sync with light/cover activity.
+
+Listens on the Home Assistant WebSocket API for ``state_changed``
+events and bumps a virtual illuminance sensor up or down whenever a
+light is switched or a cover is moved, so simulated light levels track
+what actually happens in the room.
+"""
+
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+
+import httpx
+import msgspec
+import orjson
+import websockets
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - optional, unavailable on Windows
+    uvloop = None
+else:
+    uvloop.install()
+
+HA_URL = os.environ.get("HA_URL", "http://localhost:8123")
+HA_TOKEN = os.environ.get("HA_TOKEN", "")
+SENSOR_ENTITY = os.environ.get("LUX_SENSOR_ENTITY", "sensor.lab_lux_level")
+
+log = logging.getLogger("adjust_lux")
+
+
+def _setup_logging():
+    """Log through a queue so TTY writes happen off the event loop thread.
+
+    Per-adjustment records are DEBUG; only failures log at WARNING, so
+    under bursts the hot path does a queue put instead of a syscall.
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+    return listener
+
+
+# Typed views of the trigger frames, restricted to the fields the loop
+# actually inspects. msgspec decodes straight into these (skipping the
+# intermediate dicts) and yields None for absent fields, so the hot path
+# needs neither .get chains nor try/except around current_position.
+class _TrigAttributes(msgspec.Struct):
+    current_position: float | None = None
+
+
+class _TrigState(msgspec.Struct):
+    state: str | None = None
+    attributes: _TrigAttributes | None = None
+
+
+class _Trigger(msgspec.Struct):
+    entity_id: str = ""
+    from_state: _TrigState | None = None
+    to_state: _TrigState | None = None
+
+
+class _EventVariables(msgspec.Struct):
+    trigger: _Trigger | None = None
+
+
+class _Event(msgspec.Struct):
+    variables: _EventVariables | None = None
+
+
+class _Frame(msgspec.Struct):
+    type: str = ""
+    id: int | None = None
+    success: bool | None = None
+    event: _Event | None = None
+
+
+_FRAME_DECODER = msgspec.json.Decoder(_Frame)
+
+
+async def _ws_handshake(url, token):
+    # permessage-deflate is pure CPU/memory overhead for the small JSON
+    # frames HA sends over the LAN, so turn compression off.
+    # max_queue applies backpressure at the TCP layer during event storms
+    # instead of buffering unbounded frames in this process.
+    ws = await websockets.connect(
+        url,
+        compression=None,
+        max_size=2**20,
+        max_queue=32,
+        ping_interval=20,
+        ping_timeout=20,
+    )
+    msg = orjson.loads(await ws.recv())
+    if msg.get("type") != "auth_required":
+        raise RuntimeError(f"unexpected handshake message: {msg}")
+    await ws.send(orjson.dumps({"type": "auth", "access_token": token}).decode())
+    msg = orjson.loads(await ws.recv())
+    if msg.get("type") != "auth_ok":
+        raise RuntimeError(f"authentication failed: {msg}")
+    return ws
+
+
+async def _get_watched_entities(ws):
+    """List the light/cover entity_ids from the HA entity registry."""
+    await ws.send(orjson.dumps({"id": 1, "type": "config/entity_registry/list"}).decode())
+    while True:
+        msg = orjson.loads(await ws.recv())
+        if msg.get("id") == 1 and msg.get("type") == "result":
+            if not msg.get("success"):
+                raise RuntimeError(f"entity_registry/list failed: {msg.get('error')}")
+            entities = msg.get("result") or []
+            break
+    return [
+        e["entity_id"]
+        for e in entities
+        if e["entity_id"].split(".")[0] in ("light", "cover")
+    ]
+
+
+async def _get_state(client, entity_id):
+    resp = await client.get(f"/api/states/{entity_id}")
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _state_value(state):
+    try:
+        return float(state.get("state"))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _trig_value(state):
+    if state is None or state.state is None:
+        return 0.0
+    try:
+        return float(state.state)
+    except ValueError:
+        return 0.0
+
+
+async def _get_services(client):
+    resp = await client.get("/api/services")
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _pick_set_service(services):
+    """Find the service that can write a value to the virtual sensor."""
+    for svc in services:
+        domain = svc.get("domain")
+        for name, definition in (svc.get("services") or {}).items():
+            fields = definition.get("fields") or {}
+            if domain == "virtual" and "value" in fields:
+                return domain, name
+    for svc in services:
+        domain = svc.get("domain")
+        for name, definition in (svc.get("services") or {}).items():
+            fields = definition.get("fields") or {}
+            if "value" in fields and "entity_id" in fields:
+                return domain, name
+    return None
+
+
+async def _set_sensor_value(ws, msg_id, picked, entity_id, value):
+    """Write the sensor with a call_service frame on the open WS.
+
+    Reuses the authenticated connection instead of a REST POST per
+    write; the result frame comes back on the main recv loop.
+    """
+    domain, service = picked
+    await ws.send(
+        orjson.dumps(
+            {
+                "id": msg_id,
+                "type": "call_service",
+                "domain": domain,
+                "service": service,
+                "service_data": {"entity_id": entity_id, "value": value},
+            }
+        ).decode()
+    )
+
+
+def _delta_from_event(trigger, dispatch, inc_blinds, dec_blinds):
+    """Map a decoded state trigger to a lux delta (0.0 if irrelevant).
+
+    ``dispatch`` maps ``(domain, state)`` to a delta, replacing the old
+    per-event branch cascade with a single dict lookup. Cover position
+    changes without a state change fall through to a secondary path.
+    """
+    ent = trigger.entity_id
+    domain, _, _ = ent.partition(".")
+    to_state = trigger.to_state
+    state = to_state.state if to_state is not None and to_state.state is not None else ""
+    delta = dispatch.get((domain, state))
+    if delta is not None:
+        return delta
+    if domain == "cover":
+        from_state = trigger.from_state
+        new_pos = (
+            to_state.attributes.current_position
+            if to_state is not None and to_state.attributes is not None
+            else None
+        )
+        old_pos = (
+            from_state.attributes.current_position
+            if from_state is not None and from_state.attributes is not None
+            else None
+        )
+        if new_pos is None or old_pos is None:
+            return 0.0
+        if new_pos > old_pos:
+            return inc_blinds
+        if new_pos < old_pos:
+            return -dec_blinds
+    return 0.0
+
+
+async def main():
+    _setup_logging()
+    inc_light = float(os.environ.get("LUX_INC_LIGHT", "300"))
+    dec_light = float(os.environ.get("LUX_DEC_LIGHT", "300"))
+    inc_blinds = float(os.environ.get("LUX_INC_BLINDS", "150"))
+    dec_blinds = float(os.environ.get("LUX_DEC_BLINDS", "150"))
+    dispatch = {
+        ("light", "on"): inc_light,
+        ("light", "off"): -dec_light,
+        ("cover", "open"): inc_blinds,
+        ("cover", "closed"): -dec_blinds,
+    }
+
+    ws_url = HA_URL.replace("http", "ws", 1) + "/api/websocket"
+    ws = await _ws_handshake(ws_url, HA_TOKEN)
+    client = httpx.AsyncClient(
+        base_url=HA_URL,
+        headers={"Authorization": f"Bearer {HA_TOKEN}"},
+        timeout=10.0,
+        http2=True,
+        limits=httpx.Limits(
+            max_keepalive_connections=16, max_connections=32, keepalive_expiry=300
+        ),
+    )
+    # The services list is fetched once and never changes within a run, so
+    # resolve the write service here instead of rescanning it per event.
+    services = await _get_services(client)
+    picked = _pick_set_service(services)
+    if picked is None:
+        raise RuntimeError("no service found to set the sensor value")
+
+    # Let HA filter server-side: subscribing to every state_changed event
+    # and discarding non-light/non-cover ones here wastes bandwidth and
+    # decode CPU proportional to the size of the install.
+    watched = await _get_watched_entities(ws)
+    watched.append(SENSOR_ENTITY)
+    await ws.send(
+        orjson.dumps(
+            {
+                "id": 2,
+                "type": "subscribe_trigger",
+                "trigger": {"platform": "state", "entity_id": watched},
+            }
+        ).decode()
+    )
+    # Validate the subscription ack; a rejected subscribe would
+    # otherwise leave the script idling forever with no events.
+    while True:
+        msg = orjson.loads(await ws.recv())
+        if msg.get("id") == 2 and msg.get("type") == "result":
+            if not msg.get("success"):
+                raise RuntimeError(f"subscribe_trigger failed: {msg.get('error')}")
+            break
+
+    # This process is the only regular writer of the sensor, so keep the
+    # current value locally instead of fetching it back before every write.
+    # None forces a re-sync from HA (startup, or after a failed write).
+    cur_val = None
+
+    # Light sweeps and blind motion produce bursts of events; accumulate
+    # their deltas and write once per window instead of once per event.
+    # Clamping applies to the aggregate, not to each partial delta.
+    pending_delta = 0.0
+    flush_task = None
+    flush_lock = asyncio.Lock()
+    flush_window = float(os.environ.get("LUX_FLUSH_WINDOW", "0.25"))
+    next_call_id = 1000  # service-call ids, clear of the subscription ids
+
+    async def _flush_after(delay):
+        # The lock serializes flushes: if one outlasts the window (slow
+        # state fetch), the next one queues up behind it instead of
+        # racing it for cur_val and the pending delta.
+        nonlocal cur_val, pending_delta, flush_task, next_call_id
+        await asyncio.sleep(delay)
+        async with flush_lock:
+            delta = pending_delta
+            pending_delta = 0.0
+            flush_task = None
+            if not delta:
+                return
+            try:
+                if cur_val is None:
+                    cur_val = _state_value(await _get_state(client, SENSOR_ENTITY))
+                old_val = cur_val
+                new_val = max(0.0, cur_val + delta)
+                next_call_id += 1
+                await _set_sensor_value(ws, next_call_id, picked, SENSOR_ENTITY, new_val)
+                log.debug("lux %s -> %s (delta %s)", old_val, new_val, delta)
+                cur_val = new_val
+            except (httpx.HTTPError, websockets.WebSocketException, OSError) as exc:
+                # Keep the delta and retry next window instead of
+                # dropping it with an unretrieved task exception.
+                log.warning("lux flush failed (delta %s): %s", delta, exc)
+                cur_val = None
+                pending_delta += delta
+                if flush_task is None:
+                    flush_task = asyncio.create_task(_flush_after(flush_window))
+
+    while True:
+        frame = _FRAME_DECODER.decode(await ws.recv())
+        if frame.type == "result":
+            if frame.success is False and frame.id is not None and frame.id >= 1000:
+                # A sensor write failed; drop the cache so the next flush
+                # re-syncs from HA before applying its delta.
+                log.warning("failed to set %s (call %s)", SENSOR_ENTITY, frame.id)
+                cur_val = None
+            continue
+        if frame.type != "event" or frame.event is None or frame.event.variables is None:
+            continue
+        trigger = frame.event.variables.trigger
+        if trigger is None:
+            continue
+        if trigger.entity_id == SENSOR_ENTITY:
+            # Reconcile with external writers seen on the event stream.
+            cur_val = _trig_value(trigger.to_state)
+            continue
+        delta = _delta_from_event(trigger, dispatch, inc_blinds, dec_blinds)
+        if not delta:
+            continue
+        pending_delta += float(delta)
+        if flush_task is None:
+            flush_task = asyncio.create_task(_flush_after(flush_window))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
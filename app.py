@@ -0,0 +1,844 @@
+"""Home Assistant adapter exposing areas and devices as hMAS workspaces.
+
+Serves the same hypermedia API as the Yggdrasil deployment, with HA
+areas mapped to workspaces and HA devices to artifacts. A background
+forwarder pushes ``state_changed`` events to the EnvMonitor agent and
+registers the known workspaces/artifacts on startup.
+"""
+
+import asyncio
+import functools
+import os
+import random
+import re
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+import httpx
+import orjson
+import websockets
+from fastapi import FastAPI, HTTPException, Request, Response
+from rdflib import BNode, Literal, RDF, URIRef
+from rdflib.plugin import PluginException
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - optional, unavailable on Windows
+    uvloop = None
+else:
+    # uvicorn picks uvloop up on its own with --loop auto, but installing
+    # here covers programmatic and test runs of the app too.
+    uvloop.install()
+
+from ha_utils import (
+    HCTL,
+    HMAS,
+    TD,
+    HomeAssistantRDF,
+    HomeAssistantREST,
+    HomeAssistantWS,
+)
+
+HA_URL = os.environ.get("HA_URL", "http://localhost:8123")
+HA_TOKEN = os.environ.get("HA_TOKEN", "")
+BASE_WS_URI = os.environ.get("BASE_WS_URI", "http://localhost:8080")
+MONITOR_URL = os.environ.get("MONITOR_URL", "")
+EXPLORER_URL = os.environ.get("EXPLORER_URL", "")
+AREAS = {a.strip() for a in os.environ.get("AREAS", "").split(",") if a.strip()}
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+XSD_BOOL = "http://www.w3.org/2001/XMLSchema#boolean"
+XSD_INT = "http://www.w3.org/2001/XMLSchema#integer"
+XSD_DOUBLE = "http://www.w3.org/2001/XMLSchema#double"
+XSD_STRING = "http://www.w3.org/2001/XMLSchema#string"
+
+app = FastAPI(title="Home Assistant Adapter")
+# The event subscriptions carry highly repetitive JSON, so deflate
+# pays for itself on this connection.
+ha_client = HomeAssistantWS(HA_URL, HA_TOKEN, compression="deflate")
+ha_rest = HomeAssistantREST(HA_URL, HA_TOKEN)
+
+
+class _TTLCache:
+    """Async TTL cache for slow-moving HA registry data.
+
+    The lock coalesces concurrent misses into a single upstream fetch,
+    so a burst of requests after expiry doesn't stampede HA.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._value = None
+        self._at = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self):
+        # None means never fetched; monotonic() starts near zero on a
+        # freshly booted host, so 0.0 is not a safe sentinel here.
+        return self._at is not None and time.monotonic() - self._at < self.ttl
+
+    async def get(self, fetch):
+        if self._fresh():
+            return self._value
+        async with self._lock:
+            if self._fresh():
+                return self._value
+            self._value = await fetch()
+            self._at = time.monotonic()
+            return self._value
+
+    def invalidate(self):
+        self._at = None
+        self._value = None
+
+
+_CACHE_TTL = float(os.environ.get("HA_CACHE_TTL", "30"))
+_services_cache = _TTLCache(_CACHE_TTL)
+_areas_cache = _TTLCache(_CACHE_TTL)
+_devices_cache = _TTLCache(_CACHE_TTL)
+_entities_cache = _TTLCache(_CACHE_TTL)
+_entity_area_cache = _TTLCache(_CACHE_TTL)
+
+
+async def _cached_services():
+    return await _services_cache.get(ha_rest.get_services)
+
+
+async def _fetch_areas():
+    """Fetch the area registry and index it by area_id at fill time."""
+    areas = await ha_client.get_areas()
+    return areas, {a["area_id"]: a for a in areas}
+
+
+async def _cached_areas():
+    return (await _areas_cache.get(_fetch_areas))[0]
+
+
+async def _cached_areas_by_id():
+    return (await _areas_cache.get(_fetch_areas))[1]
+
+
+async def _fetch_devices():
+    """Fetch the device registry with per-area and per-name indexes.
+
+    Built once per cache fill so request handlers do dict gets instead
+    of scanning the device list per lookup.
+    """
+    by_area = await ha_client.get_devices_by_area()
+    by_name = {
+        (area_id, d.get("name")): d
+        for area_id, area_devices in by_area.items()
+        for d in area_devices
+    }
+    return by_area, by_name
+
+
+async def _cached_area_devices(area_id):
+    return (await _devices_cache.get(_fetch_devices))[0].get(area_id, [])
+
+
+async def _cached_device_named(area_id, name):
+    return (await _devices_cache.get(_fetch_devices))[1].get((area_id, name))
+
+
+async def _cached_entities():
+    return await _entities_cache.get(ha_client.get_entities)
+
+
+async def _cached_entity_area_map():
+    return await _entity_area_cache.get(_build_entity_area_map)
+
+
+_services_index_cache = _TTLCache(_CACHE_TTL)
+
+
+async def _build_services_index():
+    """Index services as domain -> [(name, definition, legacy, applies)].
+
+    ``legacy`` is the old entity_id-field check and ``applies`` the set
+    of target entity domains, both evaluated once here instead of per
+    artifact per request.
+    """
+    index = {}
+    for svc in await _cached_services():
+        entries = []
+        for svc_name, definition in (svc.get("services") or {}).items():
+            fields = definition.get("fields") or {}
+            target = definition.get("target") or {}
+            applies = set()
+            for entry in target.get("entity") or []:
+                applies.update(entry.get("domain") or [])
+            entries.append((svc_name, definition, "entity_id" in fields, applies))
+        index[svc["domain"]] = entries
+    return index
+
+
+async def _services_index():
+    return await _services_index_cache.get(_build_services_index)
+
+
+class _RenderCache:
+    """TTL cache for serialized RDF responses.
+
+    rdflib's Turtle serializer is the dominant cost of the read
+    endpoints and their content only follows the slow-moving registry
+    data, so the rendered bytes are reusable for a full TTL. Keys must
+    be built from the negotiated format, never raw client headers, and
+    expired entries are evicted as they are seen so the dict tracks
+    live entries only.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+
+    def get(self, key):
+        hit = self._entries.get(key)
+        if hit is None:
+            return None
+        if time.monotonic() - hit[0] >= self.ttl:
+            del self._entries[key]
+            return None
+        return hit[1]
+
+    def put(self, key, value):
+        now = time.monotonic()
+        expired = [k for k, (at, _) in self._entries.items() if now - at >= self.ttl]
+        for k in expired:
+            del self._entries[k]
+        self._entries[key] = (now, value)
+        return value
+
+    def invalidate(self):
+        self._entries.clear()
+
+
+_render_cache = _RenderCache(_CACHE_TTL)
+
+
+def _accept_format(accept):
+    """Collapse a client Accept header to one of the supported formats.
+
+    The render cache is keyed on this, so client-controlled header
+    strings can only ever produce three distinct key variants.
+    """
+    if "application/x-jelly-rdf" in accept:
+        return "jelly"
+    if "application/hex+x-ndjson" in accept:
+        return "hext"
+    return "turtle"
+
+
+def _negotiated_serialize(rdf, fmt):
+    """Serialize a graph in the negotiated format where a plugin exists.
+
+    Jelly and HexTuples both parse/serialize several times faster than
+    Turtle in Python; fall back to Turtle when the client didn't ask
+    for them or the plugin isn't installed.
+    """
+    if fmt == "jelly":
+        try:
+            return rdf.g.serialize(format="jelly"), "application/x-jelly-rdf"
+        except PluginException:
+            pass
+    if fmt == "hext":
+        try:
+            return rdf.g.serialize(format="hext"), "application/hex+x-ndjson"
+        except PluginException:
+            pass
+    return rdf.serialize(), "text/turtle"
+
+
+def _base_uri():
+    return BASE_WS_URI.rstrip("/")
+
+
+# Deletion table covering the latin-1 range, where HA unit strings
+# almost always live (%, °, /, spaces); translate filters those at C
+# speed. Anything left beyond ASCII falls back to the per-character
+# isalnum() check so symbols like "℃" are still stripped.
+_UNIT_DELETE = {i: None for i in range(256) if not chr(i).isalnum()}
+
+
+# These run per service per artifact request over a small, repeating set
+# of inputs (unit strings, domain and service names), so memoize them.
+@functools.lru_cache(maxsize=512)
+def _sanitize_unit(unit):
+    cleaned = unit.translate(_UNIT_DELETE)
+    if not cleaned.isascii():
+        cleaned = "".join(ch for ch in cleaned if ch.isalnum())
+    return cleaned.lower()
+
+
+@functools.lru_cache(maxsize=512)
+def _camel_token(s):
+    out = []
+    upper = True
+    for ch in s:
+        if ch.isalnum():
+            out.append(ch.upper() if upper else ch.lower())
+            upper = False
+        else:
+            upper = True
+    return "".join(out)
+
+
+@functools.lru_cache(maxsize=512)
+def _sensor_action_name(device_class, unit):
+    name = "Get"
+    if device_class:
+        name += _camel_token(device_class)
+    if unit:
+        name += _camel_token(_sanitize_unit(unit))
+    return name if name != "Get" else "GetValue"
+
+
+_BOOL_MAP = {"on": True, "off": False}
+_INT_MATCH = re.compile(r"-?\d+$").match
+_FLOAT_MATCH = re.compile(r"-?\d+(\.\d+)?([eE][+-]?\d+)?$").match
+
+
+def _infer_value_and_type(state):
+    """Map an HA state string to a typed value and its XSD type URI.
+
+    Runs per forwarded event, so it classifies with regex matches up
+    front instead of raising and catching a ValueError per non-numeric
+    state.
+    """
+    if not isinstance(state, str):
+        return state, XSD_STRING
+    if state in _BOOL_MAP:
+        return _BOOL_MAP[state], XSD_BOOL
+    if _INT_MATCH(state):
+        return int(state), XSD_INT
+    if _FLOAT_MATCH(state):
+        return float(state), XSD_DOUBLE
+    return state, XSD_STRING
+
+
+def _pick_entity(device_entities, domain):
+    return next(
+        (e["entity_id"] for e in device_entities if e["_domain"] == domain),
+        None,
+    )
+
+
+async def _resolve_device_and_entities(workspace_id, artifact_name):
+    decoded_name = urllib.parse.unquote(artifact_name)
+    device = await _cached_device_named(workspace_id, decoded_name)
+    entities = await _cached_entities()
+    if device is None:
+        raise HTTPException(
+            status_code=404, detail=f"artifact {decoded_name!r} not found"
+        )
+    # Copies enriched with the entity domain, split once here instead of
+    # re-split at every use site (the cached registry dicts stay untouched).
+    device_entities = [
+        {**e, "_domain": e["entity_id"].partition(".")[0]}
+        for e in entities
+        if e.get("device_id") == device.get("id")
+    ]
+    return device, device_entities
+
+
+@app.get("/workspaces")
+async def list_workspaces(request: Request):
+    fmt = _accept_format(request.headers.get("accept", ""))
+    key = ("list_workspaces", fmt)
+    cached = _render_cache.get(key)
+    if cached is not None:
+        return Response(cached[0], media_type=cached[1])
+    areas = await _cached_areas()
+    rdf = HomeAssistantRDF(BASE_WS_URI)
+    for area in areas:
+        if AREAS and area["area_id"] not in AREAS:
+            continue
+        ws_uri = URIRef(f"{_base_uri()}/workspaces/{area['area_id']}")
+        rdf.g.add((ws_uri, RDF.type, HMAS.Workspace))
+        rdf.g.add((ws_uri, TD.title, Literal(area.get("name") or area["area_id"])))
+    body, ctype = _render_cache.put(key, _negotiated_serialize(rdf, fmt))
+    return Response(body, media_type=ctype)
+
+
+@app.get("/workspaces/{workspace_id}")
+async def workspace(workspace_id: str, request: Request):
+    fmt = _accept_format(request.headers.get("accept", ""))
+    key = ("workspace", workspace_id, fmt)
+    cached = _render_cache.get(key)
+    if cached is not None:
+        return Response(cached[0], media_type=cached[1])
+    area = (await _cached_areas_by_id()).get(workspace_id)
+    if area is None:
+        raise HTTPException(
+            status_code=404, detail=f"workspace {workspace_id!r} not found"
+        )
+    devices = await _cached_area_devices(workspace_id)
+    rdf = HomeAssistantRDF(BASE_WS_URI)
+    ws_uri = URIRef(f"{_base_uri()}/workspaces/{workspace_id}")
+    rdf.g.add((ws_uri, RDF.type, HMAS.Workspace))
+    rdf.g.add((ws_uri, TD.title, Literal(area.get("name") or workspace_id)))
+    for device in devices:
+        name = device.get("name") or device.get("id")
+        art = URIRef(f"{ws_uri}/artifacts/{urllib.parse.quote(name, safe='')}")
+        rdf.g.add((ws_uri, HMAS.contains, art))
+        rdf.g.add((art, RDF.type, HMAS.Artifact))
+    body, ctype = _render_cache.put(key, _negotiated_serialize(rdf, fmt))
+    return Response(body, media_type=ctype)
+
+
+@app.get("/workspaces/{workspace_id}/artifacts")
+async def list_artifacts(workspace_id: str):
+    # Three fixed-shape triples per device don't justify an rdflib graph
+    # and serializer pass; the line-buffer generator in HomeAssistantRDF
+    # emits the Turtle directly, so the output here is always Turtle.
+    key = ("list_artifacts", workspace_id)
+    cached = _render_cache.get(key)
+    if cached is not None:
+        return Response(cached[0], media_type=cached[1])
+    devices = await _cached_area_devices(workspace_id)
+    rdf = HomeAssistantRDF(BASE_WS_URI)
+    rdf.workspace_to_rdf(workspace_id, devices, ())
+    body, ctype = _render_cache.put(key, (rdf.serialize(), "text/turtle"))
+    return Response(body, media_type=ctype)
+
+
+@app.get("/workspaces/{workspace_id}/artifacts/{artifact_name}")
+async def get_artifact(workspace_id: str, artifact_name: str, request: Request):
+    fmt = _accept_format(request.headers.get("accept", ""))
+    key = ("get_artifact", workspace_id, artifact_name, fmt)
+    cached = _render_cache.get(key)
+    if cached is not None:
+        return Response(cached[0], media_type=cached[1])
+    # The prelude fetches are independent; run them concurrently so a
+    # cold cache costs one HA round-trip instead of several.
+    (device, device_entities), services_index = await asyncio.gather(
+        _resolve_device_and_entities(workspace_id, artifact_name),
+        _services_index(),
+    )
+    domains = {e["_domain"] for e in device_entities}
+
+    # Only sensor states are rendered, so ask HA for those entities
+    # individually rather than parsing the full /api/states snapshot.
+    sensor_ids = [e["entity_id"] for e in device_entities if e["_domain"] == "sensor"]
+    sem = asyncio.Semaphore(8)
+
+    async def _one_state(entity_id):
+        async with sem:
+            return await ha_rest.get_state(entity_id)
+
+    state_map = dict(
+        zip(sensor_ids, await asyncio.gather(*(_one_state(e) for e in sensor_ids)))
+    )
+
+    name = device.get("name") or device.get("id")
+    rdf = HomeAssistantRDF(BASE_WS_URI)
+    ws_uri = URIRef(f"{_base_uri()}/workspaces/{workspace_id}")
+    art = URIRef(f"{ws_uri}/artifacts/{urllib.parse.quote(name, safe='')}")
+    # Collect everything and insert in one addN pass instead of dozens
+    # of add() calls per artifact.
+    triples = [
+        (art, RDF.type, HMAS.Artifact),
+        (art, TD.title, Literal(name)),
+        (ws_uri, HMAS.contains, art),
+    ]
+
+    for domain in sorted(domains):
+        for svc_name, definition, legacy_applies, applies_to in services_index.get(
+            domain, ()
+        ):
+            if not (legacy_applies or domain in applies_to):
+                continue
+            action = BNode()
+            form = BNode()
+            triples += (
+                (art, TD.hasActionAffordance, action),
+                (action, RDF.type, TD.ActionAffordance),
+                (action, TD.name, Literal(_camel_token(domain) + _camel_token(svc_name))),
+                (action, TD.hasForm, form),
+                (form, HCTL.hasTarget, URIRef(f"{art}/{domain}.{svc_name}")),
+            )
+
+    if "sensor" in domains:
+        for e in device_entities:
+            if e["_domain"] != "sensor":
+                continue
+            entity_id = e["entity_id"]
+            st = state_map.get(entity_id) or {}
+            attrs = st.get("attributes") or {}
+            prop_name = _sensor_action_name(
+                attrs.get("device_class"), attrs.get("unit_of_measurement")
+            )
+            value, _ = _infer_value_and_type(st.get("state"))
+            prop = BNode()
+            triples += (
+                (art, TD.hasPropertyAffordance, prop),
+                (prop, RDF.type, TD.PropertyAffordance),
+                (prop, TD.name, Literal(prop_name)),
+                (prop, RDF.value, Literal(value)),
+            )
+
+    rdf.g.addN((s, p, o, rdf.g) for s, p, o in triples)
+    body, ctype = _render_cache.put(key, _negotiated_serialize(rdf, fmt))
+    return Response(body, media_type=ctype)
+
+
+@app.post("/workspaces/{workspace_id}/artifacts/{artifact_name}/{action_name}")
+async def action_ha_service(
+    workspace_id: str, artifact_name: str, action_name: str, request: Request
+):
+    device, device_entities = await _resolve_device_and_entities(
+        workspace_id, artifact_name
+    )
+    services = await _cached_services()
+
+    raw = await request.body()
+    data = orjson.loads(raw) if raw else {}
+
+    domain, _, service = action_name.partition(".")
+    svc_by_domain = {s["domain"]: s.get("services", {}) for s in services}
+    if domain not in svc_by_domain or service not in svc_by_domain[domain]:
+        raise HTTPException(status_code=404, detail=f"unknown action {action_name!r}")
+
+    entity_id = _pick_entity(device_entities, domain)
+    if entity_id is None:
+        raise HTTPException(
+            status_code=404, detail=f"no {domain} entity on {artifact_name!r}"
+        )
+    payload = {"entity_id": entity_id}
+    payload.update(data)
+    await ha_rest.call_service(domain, service, payload)
+    return Response(status_code=200)
+
+
+async def _build_entity_area_map():
+    """Map entity_id -> area_id and precompute the per-entity URIs.
+
+    The artifact profile and artifact URIs only depend on registry data,
+    so they are built (and percent-encoded) here once per cache fill
+    rather than per forwarded event.
+    """
+    devices, entities = await asyncio.gather(
+        ha_client.get_devices(), ha_client.get_entities()
+    )
+    dev_by_id = {d["id"]: d for d in devices}
+    dev_of = {e["entity_id"]: dev_by_id.get(e.get("device_id") or "") for e in entities}
+    ent_to_area = {
+        e["entity_id"]: area_id
+        for e in entities
+        if (
+            area_id := e.get("area_id")
+            or (dev_of[e["entity_id"]] or {}).get("area_id")
+        )
+    }
+    base = _base_uri()
+    ent_uris = {}
+    for entity_id, area_id in ent_to_area.items():
+        device = dev_of[entity_id] or {}
+        dev_name = device.get("name") or device.get("id") or entity_id
+        profile = (
+            f"{base}/workspaces/{area_id}/artifacts/"
+            f"{urllib.parse.quote(dev_name, safe='')}"
+        )
+        ent_uris[entity_id] = (profile, f"{profile}/#artifact")
+    return ent_to_area, ent_uris
+
+
+def _fill_monitor_payload(out, entity_id, uris, state):
+    """Fill ``out`` with a monitor notification for the entity.
+
+    Only the prop-dependent URIs are assembled here; ``prop`` follows
+    device_class, which can in principle change with the state, so it
+    cannot be frozen at registry time. Writing into a caller-supplied
+    dict lets the forwarder reuse one scratch dict per event, which is
+    safe because the payload is serialized before the next event is
+    processed.
+    """
+    artifact_profile, artifact_uri = uris
+    attrs = (state or {}).get("attributes") or {}
+    prop = attrs.get("device_class") or entity_id.split(".")[0]
+    value, value_type = _infer_value_and_type((state or {}).get("state"))
+    out["artifactUri"] = artifact_uri
+    out["propertyUri"] = f"{artifact_profile}/props/{prop}"
+    out["value"] = value
+    out["valueTypeUri"] = value_type
+    out["timestamp"] = (state or {}).get("last_updated") or datetime.now(
+        timezone.utc
+    ).isoformat()
+    out["triggerUri"] = f"{artifact_profile}/events/{prop}"
+    return out
+
+
+def _monitor_payload(entity_id, uris, state):
+    return _fill_monitor_payload({}, entity_id, uris, state)
+
+
+# Scratch dict reused by the forwarder so each event mutates six keys
+# instead of allocating a fresh payload; asyncio runs _notify_monitor
+# to the dumps() call without yielding, so nothing observes it mid-fill.
+_PAYLOAD_SCRATCH = {}
+
+# Per-entity debounce buffer: chatty sensors can emit many updates per
+# second, so the forwarder only records the latest serialized body per
+# entity and a flusher task POSTs the batch after a short window.
+_MONITOR_FLUSH_WINDOW = float(os.environ.get("MONITOR_FLUSH_WINDOW", "0.1"))
+_pending_notifications = {}
+_pending_dirty = asyncio.Event()
+
+
+def _notify_monitor(entity_id, ent_to_area, ent_uris, state):
+    area_id = ent_to_area.get(entity_id)
+    if not area_id or (AREAS and area_id not in AREAS):
+        return
+    uris = ent_uris.get(entity_id)
+    if uris is None:
+        return
+    body = orjson.dumps(
+        _fill_monitor_payload(_PAYLOAD_SCRATCH, entity_id, uris, state)
+    )
+    if MONITOR_URL:
+        _pending_notifications[entity_id] = body
+        _pending_dirty.set()
+
+
+async def _monitor_flusher_task():
+    """Drain the debounce buffer in batched, concurrent POSTs.
+
+    Bursts within the window collapse to one request per entity with
+    the latest state, trading bounded latency for far fewer outbound
+    requests towards the monitor.
+    """
+    global _pending_notifications
+    while True:
+        await _pending_dirty.wait()
+        await asyncio.sleep(_MONITOR_FLUSH_WINDOW)
+        batch, _pending_notifications = _pending_notifications, {}
+        _pending_dirty.clear()
+        http = app.state.http
+        results = await asyncio.gather(
+            *(
+                http.post(MONITOR_URL, content=body, headers=_JSON_HEADERS)
+                for body in batch.values()
+            ),
+            return_exceptions=True,
+        )
+        for entity_id, result in zip(batch, results):
+            if isinstance(result, Exception):
+                print(f"monitor notification failed for {entity_id}: {result}")
+
+
+def _expand_compressed(comp):
+    """Expand a compressed subscribe_entities state into /api/states shape."""
+    lu = comp.get("lu")
+    return {
+        "state": comp.get("s"),
+        "attributes": comp.get("a") or {},
+        "last_updated": (
+            datetime.fromtimestamp(lu, timezone.utc).isoformat() if lu else None
+        ),
+    }
+
+
+async def _forward_entity_diffs(queue, ent_to_area, ent_uris, skip_snapshot):
+    """Consume compressed subscribe_entities diffs.
+
+    HA only sends diffs for the subscribed entities, so there is no
+    client-side filtering left to do; each message is a small keyed
+    delta rather than a full state_changed envelope.
+    """
+    cur = {}
+    seeded = not skip_snapshot
+    while True:
+        msg = await queue.get()
+        if msg is None:
+            raise ConnectionError("subscription dropped")
+        event = msg.get("event") or {}
+        changed = []
+        for entity_id, comp in (event.get("a") or {}).items():
+            cur[entity_id] = comp
+            changed.append(entity_id)
+        for entity_id, diff in (event.get("c") or {}).items():
+            comp = cur.setdefault(entity_id, {})
+            plus = dict(diff.get("+") or {})
+            attrs = plus.pop("a", None)
+            comp.update(plus)
+            if attrs:
+                comp.setdefault("a", {}).update(attrs)
+            changed.append(entity_id)
+        if not seeded:
+            # On the initial connection the first message is the full
+            # snapshot of the wanted entities, which the startup
+            # registration already reported. After a reconnect the
+            # snapshot carries whatever changed during the outage, so
+            # it is forwarded (skip_snapshot is False then).
+            seeded = True
+            continue
+        for entity_id in changed:
+            _notify_monitor(
+                entity_id, ent_to_area, ent_uris, _expand_compressed(cur[entity_id])
+            )
+
+
+async def _forward_state_changed(queue, ent_to_area, ent_uris):
+    """Fallback firehose consumer for HA versions without subscribe_entities."""
+    while True:
+        msg = await queue.get()
+        if msg is None:
+            raise ConnectionError("subscription dropped")
+        data = (msg.get("event") or {}).get("data") or {}
+        entity_id = data.get("entity_id")
+        new_state = data.get("new_state")
+        if not entity_id or not new_state:
+            continue
+        _notify_monitor(entity_id, ent_to_area, ent_uris, new_state)
+
+
+async def _event_forwarder_task():
+    """Forward state changes of monitored areas to the monitor.
+
+    Lets HA filter server-side where possible: subscribe_entities with
+    the wanted entity_ids cuts inbound message volume to the monitored
+    areas instead of parsing every state_changed in the install. Both
+    the subscription and the registry calls ride the shared ha_client
+    connection instead of opening their own sockets.
+    """
+    first_connect = True
+    while True:
+        try:
+            ent_to_area, ent_uris = await _cached_entity_area_map()
+            wanted = [
+                entity_id
+                for entity_id, area_id in ent_to_area.items()
+                if not AREAS or area_id in AREAS
+            ]
+            try:
+                queue = await ha_client.subscribe(
+                    "subscribe_entities", entity_ids=wanted
+                )
+            except RuntimeError:
+                # Pre-2022.4 HA rejects subscribe_entities.
+                queue = await ha_client.subscribe(
+                    "subscribe_events", event_type="state_changed"
+                )
+                first_connect = False
+                await _forward_state_changed(queue, ent_to_area, ent_uris)
+            else:
+                skip_snapshot = first_connect
+                first_connect = False
+                await _forward_entity_diffs(
+                    queue, ent_to_area, ent_uris, skip_snapshot
+                )
+        except (websockets.ConnectionClosed, ConnectionError, OSError) as exc:
+            print(f"forwarder connection lost ({exc}); reconnecting in 3s")
+            await asyncio.sleep(3)
+
+
+# The startup registrations fire as a task burst; the semaphore caps
+# how many retrying POSTs are in flight at once and the jitter spreads
+# retries out so they don't re-synchronize on the monitor/explorer.
+_RETRY_SEM = asyncio.Semaphore(4)
+_RETRY_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+_RETRY_ATTEMPTS = 5
+
+
+async def _post_with_retries(url, payload, what, client=None):
+    client = client or app.state.http
+    body = orjson.dumps(payload)
+    for attempt in range(_RETRY_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(
+                min(8.0, 0.1 * 2**attempt) * random.uniform(0.5, 1.5)
+            )
+        try:
+            async with _RETRY_SEM:
+                resp = await client.post(
+                    url, content=body, headers=_JSON_HEADERS, timeout=_RETRY_TIMEOUT
+                )
+            resp.raise_for_status()
+            return True
+        except httpx.HTTPError as exc:
+            print(f"{what}: attempt {attempt + 1} failed: {exc}")
+    return False
+
+
+async def _register_workspace_to_explorer():
+    if not EXPLORER_URL:
+        return
+    areas = await _cached_areas()
+    for area in areas:
+        if AREAS and area["area_id"] not in AREAS:
+            continue
+        payload = {"workspaceUri": f"{_base_uri()}/workspaces/{area['area_id']}"}
+        await _post_with_retries(
+            EXPLORER_URL, payload, f"register workspace {area['area_id']}"
+        )
+
+
+async def _register_known_artifacts_to_monitor():
+    if not MONITOR_URL:
+        return
+    ent_to_area, ent_uris = await _cached_entity_area_map()
+    states = await ha_rest.get_states()
+    state_map = {s["entity_id"]: s for s in states}
+    payloads = {
+        entity_id: _monitor_payload(
+            entity_id, ent_uris[entity_id], state_map.get(entity_id)
+        )
+        for entity_id, area_id in ent_to_area.items()
+        if not AREAS or area_id in AREAS
+    }
+
+    # Fan the registrations out instead of serializing N round-trips;
+    # the semaphore keeps the burst polite towards the monitor.
+    sem = asyncio.Semaphore(16)
+    client = app.state.http
+
+    async def _post_one(entity_id, payload):
+        async with sem:
+            try:
+                await client.post(
+                    MONITOR_URL, content=orjson.dumps(payload), headers=_JSON_HEADERS
+                )
+            except httpx.HTTPError as exc:
+                print(f"monitor registration failed for {entity_id}: {exc}")
+
+    await asyncio.gather(
+        *(_post_one(entity_id, payload) for entity_id, payload in payloads.items())
+    )
+
+
+@app.on_event("startup")
+async def _startup_forwarder():
+    # One pooled client shared by the forwarder, retries and
+    # registrations, so they reuse keep-alive connections instead of
+    # paying connect/TLS setup per call.
+    app.state.http = httpx.AsyncClient(
+        timeout=10.0,
+        follow_redirects=True,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+    )
+    app.state.forwarder = asyncio.create_task(_event_forwarder_task())
+    app.state.monitor_flusher = asyncio.create_task(_monitor_flusher_task())
+    asyncio.create_task(_register_workspace_to_explorer())
+    asyncio.create_task(_register_known_artifacts_to_monitor())
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    app.state.forwarder.cancel()
+    app.state.monitor_flusher.cancel()
+    await app.state.http.aclose()
+    for cache in (
+        _services_cache,
+        _areas_cache,
+        _devices_cache,
+        _entities_cache,
+        _entity_area_cache,
+        _services_index_cache,
+        _render_cache,
+    ):
+        cache.invalidate()
+    await ha_client.close()
+    await ha_rest.close()
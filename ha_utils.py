@@ -0,0 +1,345 @@
+"""Shared helpers for talking to a Home Assistant instance.
+
+Provides a thin WebSocket client for the HA registry commands, a REST
+client for states and services, and an RDF builder that renders HA
+areas and devices as hMAS workspace/artifact descriptions.
+"""
+
+import asyncio
+import functools
+import urllib.parse
+
+import httpx
+import orjson
+import websockets
+from rdflib import Graph, Namespace
+
+HMAS = Namespace("https://purl.org/hmas/")
+TD = Namespace("https://www.w3.org/2019/wot/td#")
+JS = Namespace("https://www.w3.org/2019/wot/json-schema#")
+HCTL = Namespace("https://www.w3.org/2019/wot/hypermedia#")
+
+
+class HomeAssistantWS:
+    """Minimal client for the Home Assistant WebSocket API.
+
+    One connection multiplexes everything by message id: request/
+    response calls resolve per-id futures and subscriptions feed per-id
+    queues, so callers share a single TCP+auth handshake instead of
+    opening a socket per concern.
+    """
+
+    def __init__(self, url, token, compression=None):
+        self._url = url.rstrip("/").replace("http", "ws", 1) + "/api/websocket"
+        self._token = token
+        self._compression = compression
+        self._ws = None
+        self._next_id = 1
+        self._pending = {}
+        self._subs = {}
+        self._reader = None
+
+    async def _ensure(self):
+        if self._ws is not None:
+            return
+        # Compression defaults off — a net loss for small LAN JSON
+        # frames — but subscription-heavy callers can opt into deflate,
+        # where the repetitive entity/attribute keys compress well. Cap
+        # frame size and buffering rather than trusting the defaults.
+        self._ws = await websockets.connect(
+            self._url,
+            compression=self._compression,
+            max_size=2**22,
+            max_queue=32,
+            write_limit=2**20,
+            ping_interval=20,
+            ping_timeout=20,
+        )
+        msg = orjson.loads(await self._ws.recv())
+        if msg.get("type") != "auth_required":
+            raise RuntimeError(f"unexpected handshake message: {msg}")
+        await self._ws.send(
+            orjson.dumps({"type": "auth", "access_token": self._token}).decode()
+        )
+        msg = orjson.loads(await self._ws.recv())
+        if msg.get("type") != "auth_ok":
+            raise RuntimeError(f"authentication failed: {msg}")
+        self._pending = {}
+        self._subs = {}
+        self._reader = asyncio.create_task(self._reader_loop())
+
+    async def _reader_loop(self):
+        """Resolve response futures by message id.
+
+        A single reader makes overlapping :meth:`_call`s safe: each call
+        awaits its own future instead of competing for recv(), so callers
+        can run registry fetches concurrently with asyncio.gather.
+        """
+        try:
+            while True:
+                msg = orjson.loads(await self._ws.recv())
+                msg_id = msg.get("id")
+                if msg.get("type") == "event":
+                    queue = self._subs.get(msg_id)
+                    if queue is not None:
+                        try:
+                            queue.put_nowait(msg)
+                        except asyncio.QueueFull:
+                            # A stalled subscriber must not kill the
+                            # reader; drop the frame for that one.
+                            pass
+                    continue
+                fut = self._pending.pop(msg_id, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(msg)
+        except (websockets.ConnectionClosed, asyncio.CancelledError):
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError("websocket closed"))
+            self._pending.clear()
+            # A None sentinel tells subscribers to resubscribe; make
+            # room on a full queue so it is never lost.
+            for queue in self._subs.values():
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+            self._subs.clear()
+            self._ws = None
+
+    async def _call(self, msg_type, **kwargs):
+        await self._ensure()
+        msg_id = self._next_id
+        self._next_id += 1
+        payload = {"id": msg_id, "type": msg_type}
+        payload.update(kwargs)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = fut
+        await self._ws.send(orjson.dumps(payload).decode())
+        msg = await fut
+        if msg.get("type") != "result" or not msg.get("success"):
+            raise RuntimeError(f"{msg_type} failed: {msg.get('error')}")
+        return msg.get("result")
+
+    async def subscribe(self, msg_type, **kwargs):
+        """Open a subscription and return its queue of event frames.
+
+        Event frames for the subscription id land on the returned queue;
+        a ``None`` entry signals that the connection dropped and the
+        consumer should resubscribe.
+        """
+        await self._ensure()
+        msg_id = self._next_id
+        self._next_id += 1
+        payload = {"id": msg_id, "type": msg_type}
+        payload.update(kwargs)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = fut
+        queue = asyncio.Queue(maxsize=1024)
+        self._subs[msg_id] = queue
+        await self._ws.send(orjson.dumps(payload).decode())
+        msg = await fut
+        if msg.get("type") != "result" or not msg.get("success"):
+            self._subs.pop(msg_id, None)
+            raise RuntimeError(f"{msg_type} failed: {msg.get('error')}")
+        return queue
+
+    async def get_areas(self):
+        return await self._call("config/area_registry/list")
+
+    async def get_devices(self, area_id=None):
+        devices = await self._call("config/device_registry/list")
+        if area_id is not None:
+            devices = [d for d in devices if d.get("area_id") == area_id]
+        return devices
+
+    async def get_devices_by_area(self):
+        """Group the device registry by area_id in one pass.
+
+        Cheaper than calling :meth:`get_devices` per area when several
+        areas are of interest.
+        """
+        by_area = {}
+        for device in await self._call("config/device_registry/list"):
+            by_area.setdefault(device.get("area_id"), []).append(device)
+        return by_area
+
+    async def get_entities(self):
+        return await self._call("config/entity_registry/list")
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+
+
+class HomeAssistantREST:
+    """Minimal client for the Home Assistant REST API."""
+
+    def __init__(self, base_url, token):
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=10.0,
+            http2=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=16, max_connections=32, keepalive_expiry=300
+            ),
+        )
+
+    async def get_states(self):
+        resp = await self._client.get("/api/states")
+        resp.raise_for_status()
+        return resp.json()
+
+    async def get_state(self, entity_id):
+        """Fetch a single entity state, or None if HA doesn't know it.
+
+        Far cheaper than :meth:`get_states` when only a few entities
+        are of interest: the server filters and the response is one
+        state instead of the whole install.
+        """
+        resp = await self._client.get(f"/api/states/{entity_id}")
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return resp.json()
+
+    async def get_services(self):
+        resp = await self._client.get("/api/services")
+        resp.raise_for_status()
+        return resp.json()
+
+    async def call_service(self, domain, service, data=None, entity_id=None):
+        """Call an HA service.
+
+        ``entity_id`` accepts a single id or a list of ids; HA fans a
+        list out server-side, so callers can drive a whole group with
+        one POST instead of one request per entity.
+        """
+        payload = dict(data) if data else {}
+        if entity_id is not None:
+            payload["entity_id"] = entity_id
+        resp = await self._client.post(f"/api/services/{domain}/{service}", json=payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_TTL_HEADER = (
+    "@prefix hmas: <https://purl.org/hmas/> .\n"
+    "@prefix td: <https://www.w3.org/2019/wot/td#> .\n"
+    "@prefix js: <https://www.w3.org/2019/wot/json-schema#> .\n"
+    "@prefix hctl: <https://www.w3.org/2019/wot/hypermedia#> .\n"
+    "\n"
+)
+
+
+def _ttl_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+# Device names rarely change within a process, so don't re-scan and
+# re-encode them on every serialization.
+@functools.lru_cache(maxsize=4096)
+def _quote(name):
+    return urllib.parse.quote(name, safe="")
+
+
+class HomeAssistantRDF:
+    """Builds hMAS/TD descriptions of HA areas and devices.
+
+    The workspace generator emits Turtle text directly into a line
+    buffer: the output shapes are fixed, so going through an rdflib
+    store (triple hashing, namespace compaction on serialize) is pure
+    overhead. ``self.g`` remains available for callers that assemble
+    ad-hoc graphs; :meth:`serialize` prefers the line buffer when the
+    generator was used.
+    """
+
+    def __init__(self, base_uri):
+        self.base_uri = base_uri.rstrip("/")
+        self._lines = []
+        self.g = Graph()
+        self.g.bind("hmas", HMAS)
+        self.g.bind("td", TD)
+        self.g.bind("js", JS)
+        self.g.bind("hctl", HCTL)
+
+    def workspace_to_rdf(self, workspace_id, devices, entities):
+        """Emit a workspace and all its device artifacts as Turtle."""
+        ws = f"{self.base_uri}/workspaces/{workspace_id}"
+        emit = self._lines.append
+        emit(f"<{ws}> a hmas:Workspace .\n")
+        for device in devices:
+            name = device.get("name") or device.get("id")
+            art = f"{ws}/artifacts/{_quote(name)}"
+            emit(
+                f"<{art}> a hmas:Artifact ;\n"
+                f'    td:title "{_ttl_escape(name)}" .\n'
+                f"<{ws}> hmas:contains <{art}> .\n"
+            )
+            for entity in entities:
+                if entity.get("device_id") != device.get("id"):
+                    continue
+                domain = entity["entity_id"].split(".")[0]
+                if domain == "light":
+                    self._emit_action(art, "SetColor", input_schema=self._schema_set_color)
+                    self._emit_action(art, "SetIntensity", input_schema=self._schema_set_intensity)
+                    self._emit_action(art, "GetStatus", output_schema=self._schema_status_output)
+                elif domain == "cover":
+                    self._emit_action(art, "OpenBlinds")
+                    self._emit_action(art, "CloseBlinds")
+        return ws
+
+    def _emit_action(self, artifact, name, input_schema=None, output_schema=None):
+        parts = [
+            f"<{artifact}> td:hasActionAffordance [\n"
+            f"    a td:ActionAffordance ;\n"
+            f'    td:name "{name}" ;\n'
+            f"    td:hasForm [ hctl:hasTarget <{artifact}/{name}> ]"
+        ]
+        if input_schema is not None:
+            parts.append(f" ;\n    td:hasInputSchema {input_schema}")
+        if output_schema is not None:
+            parts.append(f" ;\n    td:hasOutputSchema {output_schema}")
+        parts.append("\n] .\n")
+        self._lines.append("".join(parts))
+
+    def _emit_schema(self, slug, values):
+        """Emit a named enum schema once and return a reference to it.
+
+        Identical schema subgraphs used to be re-materialized for every
+        artifact; cached properties below make each one appear a single
+        time per serialization, with artifacts referring to it by id.
+        """
+        uri = f"{self.base_uri}/schemas/{slug}"
+        self._lines.append(
+            f"<{uri}> a js:StringSchema ; js:enum {self._enum_block(values)} .\n"
+        )
+        return f"<{uri}>"
+
+    @staticmethod
+    def _enum_block(values):
+        return " , ".join(f'"{value}"' for value in values)
+
+    @functools.cached_property
+    def _schema_set_color(self):
+        return self._emit_schema("set-color", ("red", "green", "blue"))
+
+    @functools.cached_property
+    def _schema_set_intensity(self):
+        return self._emit_schema("set-intensity", ("100", "25", "50", "75"))
+
+    @functools.cached_property
+    def _schema_status_output(self):
+        return self._emit_schema("status-output", ("off", "on"))
+
+    def serialize(self):
+        if self._lines:
+            return _TTL_HEADER + "".join(self._lines)
+        return self.g.serialize(format="turtle")
@@ -0,0 +1,176 @@
+"""Set a property of a Home Assistant backed artifact.
+
+Usage::
+
+    python set-property.py <artifact-name> <property> <value>
+    python set-property.py --daemon
+
+Resolves the artifact name to an HA device, finds the entity and
+service that best match the requested property and calls the service
+over REST.
+
+In daemon mode the WS handshake, registries and services list are
+fetched once and then newline-delimited JSON commands of the form
+``{"artifact": ..., "property": ..., "value": ...}`` are read from
+stdin, so repeated invocations by scripted callers do not pay the
+startup cost each time.
+"""
+
+import asyncio
+import collections
+import os
+import sys
+
+import httpx
+import orjson
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - optional, unavailable on Windows
+    uvloop = None
+else:
+    uvloop.install()
+
+from ha_utils import HomeAssistantWS
+
+HA_URL = os.environ.get("HA_URL", "http://localhost:8123")
+HA_TOKEN = os.environ.get("HA_TOKEN", "")
+
+
+def build_service_index(services):
+    """Flatten the services tree once so picks don't rescan it per call."""
+    entries = []
+    for svc in services:
+        domain = svc.get("domain")
+        for name, definition in (svc.get("services") or {}).items():
+            fields = definition.get("fields") or {}
+            entries.append(
+                (
+                    domain,
+                    name,
+                    fields,
+                    "entity_id" in fields,
+                    domain == "virtual" and "value" in fields,
+                )
+            )
+    return {"entries": entries, "picks": {}}
+
+
+def select_service(svc_index, ent_domain, prop):
+    """Pick the HA service best matching the entity domain and property.
+
+    Results are memoized per (domain, property), so in daemon mode only
+    the first command with a given combination pays the scan.
+    """
+    key = (ent_domain, prop)
+    if key in svc_index["picks"]:
+        return svc_index["picks"][key]
+    best = None
+    best_score = 0
+    for domain, name, fields, has_entity_id, virtual_value in svc_index["entries"]:
+        score = 0
+        if domain == ent_domain:
+            score += 2
+        if prop in name or prop in fields:
+            score += 2
+        if has_entity_id:
+            score += 1
+        if virtual_value:
+            score += 1
+        if score > best_score:
+            best, best_score = (domain, name, fields), score
+    svc_index["picks"][key] = best
+    return best
+
+
+async def set_property(client, svc_index, dev_by_name, ents_by_device, artifact_name, prop, value):
+    """Resolve the artifact and call the best matching service once."""
+    device = dev_by_name.get(artifact_name)
+    if device is None:
+        raise LookupError(f"no device named {artifact_name!r}")
+    device_entities = ents_by_device.get(device.get("id"), [])
+    if not device_entities:
+        raise LookupError(f"device {artifact_name!r} has no entities")
+
+    for entity in device_entities:
+        ent_domain = entity["entity_id"].split(".")[0]
+        picked = select_service(svc_index, ent_domain, prop)
+        if picked is None:
+            continue
+        svc_domain, svc_name, fields = picked
+        payload = {"entity_id": entity["entity_id"]}
+        payload[prop if prop in fields else "value"] = value
+        resp = await client.post(f"/api/services/{svc_domain}/{svc_name}", json=payload)
+        resp.raise_for_status()
+        print(f"{entity['entity_id']}: {svc_domain}.{svc_name} <- {payload}")
+        return
+    raise LookupError(f"no service found for property {prop!r}")
+
+
+async def _daemon_loop(client, svc_index, dev_by_name, ents_by_device):
+    """Serve NDJSON commands from stdin over the cached handshake state."""
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            return
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            cmd = orjson.loads(line)
+            await set_property(
+                client,
+                svc_index,
+                dev_by_name,
+                ents_by_device,
+                cmd["artifact"],
+                cmd["property"],
+                cmd["value"],
+            )
+        except (KeyError, ValueError, LookupError, httpx.HTTPError) as exc:
+            print(f"error: {exc}", file=sys.stderr)
+
+
+async def main():
+    args = [a for a in sys.argv[1:] if a != "--daemon"]
+    daemon = "--daemon" in sys.argv[1:]
+    if not daemon and len(args) != 3:
+        print(__doc__.strip(), file=sys.stderr)
+        raise SystemExit(2)
+
+    ws = HomeAssistantWS(HA_URL, HA_TOKEN)
+    devices, entities = await asyncio.gather(ws.get_devices(), ws.get_entities())
+    await ws.close()
+
+    # Index the registries once so lookups stay O(1) even on installs
+    # with thousands of entities (and per command in daemon mode).
+    dev_by_name = {d.get("name"): d for d in devices}
+    ents_by_device = collections.defaultdict(list)
+    for entity in entities:
+        ents_by_device[entity.get("device_id")].append(entity)
+
+    async with httpx.AsyncClient(
+        base_url=HA_URL,
+        headers={"Authorization": f"Bearer {HA_TOKEN}"},
+        timeout=10.0,
+    ) as client:
+        services_resp = await client.get("/api/services")
+        services_resp.raise_for_status()
+        services = services_resp.json()
+        svc_index = build_service_index(services)
+
+        if daemon:
+            await _daemon_loop(client, svc_index, dev_by_name, ents_by_device)
+        else:
+            artifact_name, prop, value = args
+            try:
+                await set_property(
+                    client, svc_index, dev_by_name, ents_by_device, artifact_name, prop, value
+                )
+            except LookupError as exc:
+                raise SystemExit(str(exc)) from exc
+
+
+if __name__ == "__main__":
+    asyncio.run(main())